@@ -0,0 +1,30 @@
+"""
+Ahead-of-time build of FlappyEnv's kernels.
+
+    python build_flappy_kernel.py
+
+compiles flappy_env's _step_core, _write_obs and _spawn_pipe into a
+`flappy_kernel` extension module next to this file, together with a
+fingerprint of their source. flappy_env only uses the extension while that
+fingerprint still matches, and otherwise falls back to the Numba JIT, so
+the build is optional and a stale one is ignored.
+"""
+from pathlib import Path
+
+from numba.pycc import CC
+
+from flappy_env import _AOT_EXPORTS, _kernel_source_hash
+
+SOURCE_HASH = _kernel_source_hash()
+
+def source_hash():
+    return SOURCE_HASH
+
+cc = CC("flappy_kernel")
+cc.output_dir = str(Path(__file__).resolve().parent)
+for name, (kernel, signature) in _AOT_EXPORTS.items():
+    cc.export(name, signature)(kernel.py_func)
+cc.export("source_hash", "i8()")(source_hash)
+
+if __name__ == "__main__":
+    cc.compile()
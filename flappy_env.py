@@ -1,201 +1,415 @@
+import hashlib
+import inspect
 import math
-import random
-import pygame as pg
+from dataclasses import dataclass
 import gymnasium as gym
 from gymnasium import spaces
 import numpy as np
+from numba import njit, prange
 
 # ---------- copy / paste constants from flappy_square.py ---------------
 WIDTH, HEIGHT = 480, 640
-GRAVITY = 0.35
-FLAP_STRENGTH = -7.5
+GRAVITY = np.float32(0.35)
+FLAP_STRENGTH = np.float32(-7.5)
 PIPE_INTERVAL_TICKS = 90     # ~1.5 s at 60 FPS
-PIPE_SPEED_START  = 3.0
+PIPE_SPEED_START  = np.float32(3.0)
+PIPE_SPEED_INC    = np.float32(0.15)
 GAP_START         = 170
 GAP_MIN           = 100
 GAP_DEC           = 4
 SQUARE_SIZE       = 38
+PIPE_W            = 60
+MAX_PIPES         = 8        # more than can ever be on screen at once
+RNG_RING_SIZE     = 256      # gap positions drawn per np_random call
+RNG_DRAW_HIGH     = 1_000_000  # raw draws lie in [0, RNG_DRAW_HIGH)
+MAX_EPISODE_STEPS = 10_000   # training time limit, replaces gym's TimeLimit
+
+# observation scaling, as float32 multipliers
+INV_HALF_HEIGHT   = np.float32(2.0 / HEIGHT)
+INV_WIDTH         = np.float32(1.0 / WIDTH)
+INV_VEL_SCALE     = np.float32(1.0 / 10)
+INV_GAP_RANGE     = np.float32(1.0 / (GAP_START - GAP_MIN))
+# the same scales folded with their offsets, so each obs term is one FMA
+INV_HEIGHT        = np.float32(1.0 / HEIGHT)     # gap_h / 2 * INV_HALF_HEIGHT
+HORIZ_OBS_OFFSET  = np.float32((PIPE_W - WIDTH // 4) / WIDTH)
+GAP_OBS_OFFSET    = np.float32(-GAP_MIN / (GAP_START - GAP_MIN))
+PROXIMITY_SCALE   = np.float32(0.1 * 2.0 / HEIGHT)
 # ----------------------------------------------------------------------
 
+@dataclass(slots=True)
 class _Square:
-    def __init__(self):
-        self.y = HEIGHT / 2
-        self.vel = 0.0
-
-    def flap(self):
-        self.vel = FLAP_STRENGTH
-
-    def update(self):
-        self.vel += GRAVITY
-        self.y += self.vel
-
-    @property
-    def rect(self):
-        return pg.Rect(WIDTH // 4, int(self.y), SQUARE_SIZE, SQUARE_SIZE)
-
-class _Pipe:
-    def __init__(self, x, gap_y, gap_h, w=60):
-        self.x = x
-        self.w = w
-        self.gap_y = gap_y
-        self.gap_h = gap_h
-        self.passed = False
-
-    def update(self, speed):
-        self.x -= speed
-
-    @property
-    def rects(self):
-        top = pg.Rect(self.x, 0, self.w, self.gap_y)
-        bottom = pg.Rect(self.x, self.gap_y+self.gap_h, self.w,
-                         HEIGHT - (self.gap_y+self.gap_h))
-        return top, bottom
-
-    @property
-    def off_screen(self):
-        return self.x + self.w < 0
+    y: float = HEIGHT / 2
+    vel: float = 0.0
+
+@njit(cache=True, fastmath=True)
+def _step_core(pipe_x, pipe_gap_y, pipe_gap_h, n, front, sq_y, sq_vel,
+               pipe_speed, gap_h, action):
+    """
+    Advance the square and the live pipes [0, n) by one tick, in place.
+    Pipes are kept in spawn order, so the passed ones form the prefix
+    [0, front) and pipe `front` is always the next one to fly through.
+    Returns (reward, done, sq_y, sq_vel, pipe_speed, gap_h, n, front,
+    score_delta).
+    """
+    # keep every scalar in float32 so nothing is silently widened
+    f32 = np.float32
+    sq_y = f32(sq_y)
+    sq_vel = f32(sq_vel)
+    pipe_speed = f32(pipe_speed)
+    gap_h = f32(gap_h)
+    reward = f32(-0.01)  # base survival penalty
+    done = False
+    score_delta = 0
+
+    # action is 0 or 1: a flap replaces the velocity without a branch
+    sq_vel = sq_vel + f32(action) * (FLAP_STRENGTH - sq_vel)
+    sq_vel += GRAVITY
+    sq_y += sq_vel
+
+    for i in range(n):
+        pipe_x[i] -= pipe_speed
+
+    # count the pipes the square just got past
+    sx0 = f32(WIDTH // 4)
+    pipe_w = f32(PIPE_W)
+    while front < n and pipe_x[front] + pipe_w < sx0:
+        front += 1
+        score_delta += 1
+        reward += f32(1.0)  # passing pipe reward
+        pipe_speed += PIPE_SPEED_INC
+        gap_h = max(f32(GAP_MIN), gap_h - f32(GAP_DEC))
+
+    # drop pipes that left the screen; they are always a prefix. Shift the
+    # rest down rather than swap-popping, which would break the spawn order
+    # `front` relies on; at most a handful of live pipes ever move.
+    drop = 0
+    while drop < front and pipe_x[drop] + pipe_w < f32(0.0):
+        drop += 1
+    if drop:
+        for i in range(drop, n):
+            pipe_x[i - drop] = pipe_x[i]
+            pipe_gap_y[i - drop] = pipe_gap_y[i]
+            pipe_gap_h[i - drop] = pipe_gap_h[i]
+        n -= drop
+        front -= drop
+
+    # collision detection (axis-aligned boxes)
+    sx1 = f32(WIDTH // 4 + SQUARE_SIZE)
+    sy1 = sq_y + f32(SQUARE_SIZE)
+    collided = sq_y < f32(0.0) or sy1 > f32(HEIGHT)
+    for i in range(n):
+        px0 = pipe_x[i]
+        if px0 < sx1 and px0 + pipe_w > sx0:
+            if sq_y < pipe_gap_y[i] or sy1 > pipe_gap_y[i] + pipe_gap_h[i]:
+                collided = True
+    if collided:
+        reward = f32(-1.0)
+        done = True
+    elif front < n:
+        # gap-center reward shaping; a crash is just -1
+        gap_centre = pipe_gap_y[front] + pipe_gap_h[front] * f32(0.5)
+        dist = abs(sq_y - gap_centre)
+        reward += f32(0.1) - dist * PROXIMITY_SCALE
+
+    return reward, done, sq_y, sq_vel, pipe_speed, gap_h, n, front, score_delta
+
+@njit(cache=True, fastmath=True)
+def _write_obs(out, pipe_x, pipe_gap_y, pipe_gap_h, n, front, sq_y, sq_vel,
+               gap_h):
+    """Write the FlappyEnv observation for the next pipe `front` into `out`."""
+    f32 = np.float32
+    lo, hi = f32(-1.0), f32(1.0)
+    sq_y = f32(sq_y)
+    if front >= n:
+        out[0] = f32(0.0)
+        out[1] = f32(1.0)
+        gap_h = f32(gap_h)
+    else:
+        gap_h = pipe_gap_h[front]
+        vert = (sq_y - pipe_gap_y[front]) * INV_HALF_HEIGHT - gap_h * INV_HEIGHT
+        out[0] = min(max(vert, lo), hi)
+        out[1] = pipe_x[front] * INV_WIDTH + HORIZ_OBS_OFFSET
+    # vertical distance and fall speed can leave [-1, 1] just before a
+    # crash; clip them so every obs lies inside observation_space
+    out[2] = min(max(f32(sq_vel) * INV_VEL_SCALE, lo), hi)
+    out[3] = gap_h * INV_GAP_RANGE + GAP_OBS_OFFSET
+
+@njit(cache=True)
+def _spawn_pipe(pipe_x, pipe_gap_y, pipe_gap_h, n, tick, gap_h, r):
+    """
+    Append a pipe at the right edge if one is due this tick. `r` is a raw
+    draw in [0, RNG_DRAW_HIGH) that picks the gap top in
+    [60, HEIGHT - 60 - gap_h]. Returns (n, spawned).
+    """
+    if tick % PIPE_INTERVAL_TICKS != 0 or n >= MAX_PIPES:
+        return n, False
+    pipe_x[n] = WIDTH
+    pipe_gap_y[n] = 60 + r % (HEIGHT - 119 - int(gap_h))
+    pipe_gap_h[n] = gap_h
+    return n + 1, True
+
+@njit(cache=True, fastmath=True, parallel=True)
+def _step_batch(sq_y, sq_vel, pipe_x, pipe_gap_y, pipe_gap_h, n_pipes, front,
+                gap_h, pipe_speed, tick, score, actions, rng_ring, rng_cursor,
+                need_refill, max_steps, out_obs, out_terminal_obs, out_reward,
+                out_done, out_truncated, out_score):
+    """
+    Advance all K FlappyVecEnv environments by one tick. Rows that finish
+    are written to out_terminal_obs / out_score and reset in place, like
+    SB3's autoreset. Each row takes gap draws from its rng_ring row; when a
+    row's cursor reaches the end, need_refill[0] is set for the caller.
+    """
+    for k in prange(sq_y.shape[0]):
+        # spawn pipes; the ring cursor only moves when a pipe is placed
+        n_pipes[k], spawned = _spawn_pipe(
+            pipe_x[k], pipe_gap_y[k], pipe_gap_h[k],
+            n_pipes[k], tick[k], gap_h[k], rng_ring[k, rng_cursor[k]])
+        if spawned:
+            rng_cursor[k] += 1
+            if rng_cursor[k] == RNG_RING_SIZE:
+                need_refill[0] = True
+
+        (reward, done, sq_y[k], sq_vel[k], pipe_speed[k], gap_h[k],
+         n_pipes[k], front[k], score_delta) = _step_core(
+            pipe_x[k], pipe_gap_y[k], pipe_gap_h[k],
+            n_pipes[k], front[k], sq_y[k], sq_vel[k], pipe_speed[k], gap_h[k],
+            actions[k])
+        score[k] += score_delta
+        tick[k] += 1
+        truncated = not done and tick[k] >= max_steps
+
+        out_reward[k] = reward
+        out_done[k] = done or truncated
+        out_truncated[k] = truncated
+        _write_obs(out_obs[k], pipe_x[k], pipe_gap_y[k], pipe_gap_h[k],
+                   n_pipes[k], front[k], sq_y[k], sq_vel[k], gap_h[k])
+
+        if done or truncated:
+            out_terminal_obs[k] = out_obs[k]
+            out_score[k] = score[k]
+            _reset_row(k, sq_y, sq_vel, n_pipes, front, gap_h, pipe_speed,
+                       tick, score)
+            _write_obs(out_obs[k], pipe_x[k], pipe_gap_y[k], pipe_gap_h[k],
+                       0, 0, sq_y[k], sq_vel[k], gap_h[k])
+
+@njit(cache=True)
+def _reset_row(k, sq_y, sq_vel, n_pipes, front, gap_h, pipe_speed, tick,
+               score):
+    sq_y[k] = HEIGHT / 2
+    sq_vel[k] = 0.0
+    n_pipes[k] = 0
+    front[k] = 0
+    gap_h[k] = GAP_START
+    pipe_speed[k] = PIPE_SPEED_START
+    tick[k] = 0
+    score[k] = 0
+
+def _warmup(step=_step_core, write_obs=_write_obs, spawn=_spawn_pipe):
+    """Compile (or, for prebuilt kernels, type-check) the kernels once."""
+    pipe_f = np.zeros(1, dtype=np.float32)
+    step(pipe_f, pipe_f.copy(), pipe_f.copy(), 0, 0, HEIGHT / 2, 0.0,
+         float(PIPE_SPEED_START), float(GAP_START), 0)
+    write_obs(np.zeros(4, dtype=np.float32), pipe_f, pipe_f, pipe_f, 0, 0,
+              HEIGHT / 2, 0.0, float(GAP_START))
+    spawn(pipe_f, pipe_f.copy(), pipe_f.copy(), 0, 1, float(GAP_START),
+          np.int32(0))
+
+# Kernels build_flappy_kernel.py compiles ahead of time, with the argument
+# types FlappyEnv calls them with.
+_AOT_EXPORTS = {
+    "step_core": (_step_core,
+                  "Tuple((f4, b1, f4, f4, f4, f4, i8, i8, i8))"
+                  "(f4[:], f4[:], f4[:], i8, i8, f8, f8, f8, f8, i8)"),
+    "write_obs": (_write_obs,
+                  "void(f4[:], f4[:], f4[:], f4[:], i8, i8, f8, f8, f8)"),
+    "spawn_pipe": (_spawn_pipe,
+                   "Tuple((i8, b1))"
+                   "(f4[:], f4[:], f4[:], i8, i8, f8, i4)"),
+}
+
+def _kernel_source_hash():
+    """
+    Fingerprint of the exported kernels: their source, signatures and the
+    module constants they read (which AOT compilation freezes in).
+    """
+    h = hashlib.sha256()
+    env_globals = globals()
+    for name, (kernel, signature) in _AOT_EXPORTS.items():
+        func = kernel.py_func
+        h.update(f"{name} {signature}\n".encode())
+        h.update(inspect.getsource(func).encode())
+        for g in func.__code__.co_names:
+            value = env_globals.get(g)
+            if isinstance(value, (int, float, np.number)):
+                h.update(f"{g}={value!r}\n".encode())
+    # fits the i8 the extension returns it as
+    return int.from_bytes(h.digest()[:7], "little")
+
+def _load_prebuilt_kernels():
+    """
+    The flappy_kernel extension's (step_core, write_obs, spawn_pipe), or
+    None if it is missing, was built from other kernel source, or rejects
+    the argument types FlappyEnv passes.
+    """
+    try:
+        import flappy_kernel
+        if flappy_kernel.source_hash() != _kernel_source_hash():
+            return None
+        kernels = (flappy_kernel.step_core, flappy_kernel.write_obs,
+                   flappy_kernel.spawn_pipe)
+        _warmup(*kernels)
+    except (ImportError, AttributeError, TypeError):
+        return None
+    return kernels
+
+# Prefer the ahead-of-time build from build_flappy_kernel.py when it is up to
+# date, so new processes (e.g. SubprocVecEnv workers) skip the JIT compile.
+_step_one, _write_obs_one, _spawn_one = (
+    _load_prebuilt_kernels() or (_step_core, _write_obs, _spawn_pipe))
 
 class FlappyEnv(gym.Env):
     """
     Observation  (float32):
-        0 : vertical distance (square→gap centre)  [‑∞, ∞]
+        0 : vertical distance (square→gap centre)  [‑HEIGHT/2, HEIGHT/2]
         1 : horizontal distance to next pipe front [0, WIDTH]
-        2 : square vertical velocity                [‑∞, ∞]
+        2 : square vertical velocity                [‑10, 10]
         3 : current gap height                      [GAP_MIN, GAP_START]
+        (scaled to the observation_space box; 0 and 2 are clipped)
     Actions (Discrete):
         0 : do nothing
         1 : flap
     Reward:
         +1 for every pipe passed
         ‑0.01 each step alive (encourages speed)
-        ‑1  on collision → episode terminated
+        +0.1 scaled by closeness to the next gap centre
+        ‑1  on collision → episode terminated (no shaping term)
+    Episodes are truncated after `max_episode_steps` ticks (None = never),
+    so no TimeLimit wrapper is needed.
     """
     metadata = {"render_modes": ["human", "rgb_array"], "render_fps": 60}
 
-    def __init__(self, render_mode=None):
+    def __init__(self, render_mode=None, max_episode_steps=None):
         super().__init__()
         self.render_mode = render_mode
+        self.max_episode_steps = max_episode_steps
         self.action_space = spaces.Discrete(2)
-        # State values are normalised into ~[‑1, 1]
+        # State values are normalised (and clipped) into [‑1, 1]
         high = np.array([ 1.0,  1.0,  1.0,  1.0], dtype=np.float32)
         self.observation_space = spaces.Box(-high, high, dtype=np.float32)
+        self._obs = np.zeros(4, dtype=np.float32)
 
-        # pygame init only if we need visuals
+        # pygame is only imported (and SDL initialised) if we need visuals
         if render_mode == "human":
+            import pygame as pg
             pg.init()
             self.screen = pg.display.set_mode((WIDTH, HEIGHT))
             pg.display.set_caption("Flappy‑Square RL")
             self.clock = pg.time.Clock()
+            self._prev_rects = None     # what the last frame drew
 
     # --------------- Gym API ----------------
     def reset(self, *, seed=None, options=None):
         super().reset(seed=seed)
+        if _step_one is _step_core and not _step_core.signatures:
+            _warmup()
         self.square = _Square()
-        self.pipes = []
+        # pipe state as structure-of-arrays; slots [0, n_pipes) are live
+        self.pipe_x = np.empty(MAX_PIPES, dtype=np.float32)
+        self.pipe_gap_y = np.empty(MAX_PIPES, dtype=np.float32)
+        self.pipe_gap_h = np.empty(MAX_PIPES, dtype=np.float32)
+        self.n_pipes = 0
+        self.front = 0      # index of the next pipe to fly through
+        self._refill_rng_ring()
         self.tick = 0
-        self.pipe_speed = PIPE_SPEED_START
-        self.gap_h = GAP_START
+        # Python floats on this side; _step_core narrows them to float32
+        self.pipe_speed = float(PIPE_SPEED_START)
+        self.gap_h = float(GAP_START)
         self.score = 0
         obs = self._get_obs()
         return obs, {}
 
     def step(self, action):
-        done = False
-        reward = -0.01  # base survival penalty
-
-        if action == 1:
-            self.square.flap()
-
-        self.square.update()
-
-        # spawn pipes
-        if self.tick % PIPE_INTERVAL_TICKS == 0:
-            gap_y = random.randint(60, HEIGHT - 60 - self.gap_h)
-            self.pipes.append(_Pipe(WIDTH, gap_y, self.gap_h))
-
-        # update pipes
-        for pipe in list(self.pipes):
-            pipe.update(self.pipe_speed)
-            if not pipe.passed and pipe.x + pipe.w < WIDTH // 4:
-                pipe.passed = True
-                self.score += 1
-                reward += 1.0  # passing pipe reward
-                self.pipe_speed += 0.15
-                self.gap_h = max(GAP_MIN, self.gap_h - GAP_DEC)
-            if pipe.off_screen:
-                self.pipes.remove(pipe)
-
-        # collision detection
-        collided = (
-            self.square.y < 0 or
-            self.square.y + SQUARE_SIZE > HEIGHT or
-            any(self.square.rect.colliderect(r)
-                for p in self.pipes for r in p.rects)
-        )
-        if collided:
-            reward = -1.0
-            done = True
-
-        # gap-center reward shaping
-        next_pipe = min(
-            (p for p in self.pipes if p.x + p.w >= WIDTH // 4),
-            default=None,
-            key=lambda p: p.x
-        )
-        if next_pipe:
-            gap_centre = next_pipe.gap_y + next_pipe.gap_h / 2
-            dist = abs(self.square.y - gap_centre)
-            proximity_reward = 0.1 * (1.0 - dist / (HEIGHT / 2))
-            reward += proximity_reward
+        # spawn pipes; the ring cursor only moves when a pipe is placed
+        if self._rng_cursor == RNG_RING_SIZE:
+            self._refill_rng_ring()
+        self.n_pipes, spawned = _spawn_one(
+            self.pipe_x, self.pipe_gap_y, self.pipe_gap_h,
+            self.n_pipes, self.tick, self.gap_h,
+            self._rng_ring[self._rng_cursor])
+        self._rng_cursor += spawned
+
+        sq = self.square
+        (reward, done, sq.y, sq.vel, self.pipe_speed, self.gap_h,
+         self.n_pipes, self.front, score_delta) = _step_one(
+            self.pipe_x, self.pipe_gap_y, self.pipe_gap_h,
+            self.n_pipes, self.front, sq.y, sq.vel, self.pipe_speed, self.gap_h,
+            int(action))
+        self.score += score_delta
 
         self.tick += 1
+        truncated = (not done and self.max_episode_steps is not None
+                     and self.tick >= self.max_episode_steps)
         obs = self._get_obs()
         info = {"score": self.score}
 
         if self.render_mode == "human":
             self._render()
 
-        return obs, reward, done, False, info
+        return obs, reward, done, truncated, info
+
 
+    def _refill_rng_ring(self):
+        """Draw the next batch of raw gap positions from the seeded RNG."""
+        self._rng_ring = self.np_random.integers(
+            0, RNG_DRAW_HIGH, size=RNG_RING_SIZE, dtype=np.int32)
+        self._rng_cursor = 0
 
     def _get_obs(self):
-        # next pipe
-        next_pipe = min(
-            (p for p in self.pipes if p.x + p.w >= WIDTH//4),
-            default=None, key=lambda p: p.x)
-        if next_pipe is None:
-            horiz = WIDTH
-            vert  = 0
-            gap_h = self.gap_h
-        else:
-            horiz = next_pipe.x + next_pipe.w - WIDTH//4
-            gap_centre = next_pipe.gap_y + next_pipe.gap_h / 2
-            vert = self.square.y - gap_centre
-            gap_h = next_pipe.gap_h
-
-        # normalise roughly to [‑1,1]
-        v = np.array([
-            vert / (HEIGHT/2),
-            horiz / WIDTH,
-            self.square.vel / 10,
-            (gap_h - GAP_MIN) / (GAP_START - GAP_MIN)
-        ], dtype=np.float32)
-        return v
+        _write_obs_one(self._obs, self.pipe_x, self.pipe_gap_y, self.pipe_gap_h,
+                       self.n_pipes, self.front, self.square.y,
+                       self.square.vel, self.gap_h)
+        # copy: DummyVecEnv keeps the terminal obs while the env resets
+        return self._obs.copy()
 
     def _render(self):
+        import pygame as pg
+
         for event in pg.event.get():
             if event.type == pg.QUIT:
                 pg.quit(); raise SystemExit
 
-        self.screen.fill((20,20,30))
+        # only repaint what moved: erase last frame's shapes, draw the new
+        # ones and push just those regions to the display
+        bg = (20,20,30)
+        if self._prev_rects is None:
+            self.screen.fill(bg)
+        else:
+            for r in self._prev_rects:
+                self.screen.fill(bg, r)
+
+        rects = []
         # draw pipes
-        for p in self.pipes:
-            for r in p.rects:
-                pg.draw.rect(self.screen, (50,200,90), r, border_radius=4)
-        pg.draw.rect(self.screen, (250,240,50), self.square.rect, border_radius=6)
-        pg.display.flip()
+        for i in range(self.n_pipes):
+            x = float(self.pipe_x[i])
+            gap_y = float(self.pipe_gap_y[i])
+            gap_bottom = gap_y + float(self.pipe_gap_h[i])
+            top = pg.Rect(x, 0, PIPE_W, gap_y)
+            bottom = pg.Rect(x, gap_bottom, PIPE_W, HEIGHT - gap_bottom)
+            pg.draw.rect(self.screen, (50,200,90), top, border_radius=4)
+            pg.draw.rect(self.screen, (50,200,90), bottom, border_radius=4)
+            rects += (top, bottom)
+        square = pg.Rect(WIDTH // 4, int(self.square.y), SQUARE_SIZE, SQUARE_SIZE)
+        pg.draw.rect(self.screen, (250,240,50), square, border_radius=6)
+        rects.append(square)
+
+        if self._prev_rects is None:
+            pg.display.flip()
+        else:
+            pg.display.update(self._prev_rects + rects)
+        self._prev_rects = rects
         self.clock.tick(self.metadata["render_fps"])
 
     def close(self):
         if self.render_mode == "human":
+            import pygame as pg
             pg.quit()
@@ -0,0 +1,129 @@
+import numba
+import numpy as np
+from stable_baselines3.common.vec_env import VecEnv
+
+# The batch kernels live in flappy_env so that Numba's on-disk cache, which
+# is keyed on the defining file, is invalidated by any physics change.
+from flappy_env import (
+    MAX_PIPES, MAX_EPISODE_STEPS, RNG_DRAW_HIGH, RNG_RING_SIZE, FlappyEnv,
+    _reset_row,
+    _step_batch, _write_obs,
+)
+
+class FlappyVecEnv(VecEnv):
+    """
+    K headless FlappyEnv copies stepped together by one parallel Numba call.
+
+    State lives in (K,) arrays for the square/difficulty and (K, MAX_PIPES)
+    arrays for the pipes, so a vec step is a single interpreter trip instead
+    of K FlappyEnv.step calls. Finished episodes reset automatically and
+    report their last observation as info["terminal_observation"].
+
+    `num_threads` caps the Numba threads the prange loop is spread over;
+    it defaults to NUMBA_NUM_THREADS (set that to the physical core count)
+    and never exceeds that or num_envs, since Numba cannot start more
+    threads than NUMBA_NUM_THREADS and spare threads only add sync cost.
+    """
+
+    def __init__(self, num_envs, max_episode_steps=MAX_EPISODE_STEPS,
+                 seed=None, num_threads=None):
+        self.max_episode_steps = max_episode_steps
+        # None means no time limit, as in FlappyEnv; the kernel needs an int
+        self._max_steps = (np.iinfo(np.int64).max if max_episode_steps is None
+                           else max_episode_steps)
+        max_threads = numba.config.NUMBA_NUM_THREADS
+        self.num_threads = min(num_threads or max_threads, max_threads,
+                               num_envs)
+        self.render_mode = None
+        proto = FlappyEnv()
+        super().__init__(num_envs, proto.observation_space, proto.action_space)
+        self._rng = np.random.default_rng(seed)
+
+        K = num_envs
+        self.sq_y = np.empty(K, dtype=np.float32)
+        self.sq_vel = np.empty(K, dtype=np.float32)
+        self.pipe_x = np.empty((K, MAX_PIPES), dtype=np.float32)
+        self.pipe_gap_y = np.empty((K, MAX_PIPES), dtype=np.float32)
+        self.pipe_gap_h = np.empty((K, MAX_PIPES), dtype=np.float32)
+        self.n_pipes = np.zeros(K, dtype=np.int32)
+        self.front = np.zeros(K, dtype=np.int32)
+        self.gap_h = np.empty(K, dtype=np.float32)
+        self.pipe_speed = np.empty(K, dtype=np.float32)
+        self.tick = np.zeros(K, dtype=np.int32)
+        self.score = np.zeros(K, dtype=np.int32)
+        # per-env rings of raw gap draws, as in FlappyEnv
+        self._rng_ring = np.empty((K, RNG_RING_SIZE), dtype=np.int32)
+        self._rng_cursor = np.zeros(K, dtype=np.int32)
+        self._need_refill = np.zeros(1, dtype=np.bool_)
+
+        self._obs = np.zeros((K, 4), dtype=np.float32)
+        self._terminal_obs = np.zeros((K, 4), dtype=np.float32)
+        self._rewards = np.zeros(K, dtype=np.float32)
+        self._dones = np.zeros(K, dtype=np.bool_)
+        self._truncated = np.zeros(K, dtype=np.bool_)
+        self._final_score = np.zeros(K, dtype=np.int32)
+        self._actions = np.zeros(K, dtype=np.int64)
+
+    # --------------- VecEnv API ----------------
+    def reset(self):
+        if self._seeds[0] is not None:
+            self._rng = np.random.default_rng(self._seeds[0])
+        self._reset_seeds()
+        self._refill_rng_rings(np.arange(self.num_envs))
+        for k in range(self.num_envs):
+            _reset_row(k, self.sq_y, self.sq_vel, self.n_pipes, self.front,
+                       self.gap_h, self.pipe_speed, self.tick, self.score)
+            _write_obs(self._obs[k], self.pipe_x[k], self.pipe_gap_y[k],
+                       self.pipe_gap_h[k], 0, 0, self.sq_y[k], self.sq_vel[k],
+                       self.gap_h[k])
+        return self._obs.copy()
+
+    def step_async(self, actions):
+        self._actions[:] = actions
+
+    def step_wait(self):
+        numba.set_num_threads(self.num_threads)
+        _step_batch(
+            self.sq_y, self.sq_vel, self.pipe_x, self.pipe_gap_y,
+            self.pipe_gap_h, self.n_pipes, self.front, self.gap_h,
+            self.pipe_speed, self.tick, self.score, self._actions,
+            self._rng_ring, self._rng_cursor, self._need_refill,
+            self._max_steps,
+            self._obs, self._terminal_obs, self._rewards, self._dones,
+            self._truncated, self._final_score)
+        if self._need_refill[0]:
+            self._refill_rng_rings(
+                np.flatnonzero(self._rng_cursor == RNG_RING_SIZE))
+
+        infos = [{} for _ in range(self.num_envs)]
+        for k in np.flatnonzero(self._dones):
+            infos[k]["terminal_observation"] = self._terminal_obs[k].copy()
+            infos[k]["score"] = int(self._final_score[k])
+            infos[k]["TimeLimit.truncated"] = bool(self._truncated[k])
+        return (self._obs.copy(), self._rewards.copy(), self._dones.copy(),
+                infos)
+
+    def close(self):
+        pass
+
+    def _refill_rng_rings(self, rows):
+        """Draw fresh raw gap positions for the given env rows."""
+        self._rng_ring[rows] = self._rng.integers(
+            0, RNG_DRAW_HIGH, size=(len(rows), RNG_RING_SIZE), dtype=np.int32)
+        self._rng_cursor[rows] = 0
+        self._need_refill[0] = False
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name)] * len(self._get_indices(indices))
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None,
+                   **method_kwargs):
+        # all envs share this object's state arrays, so call it once
+        result = getattr(self, method_name)(*method_args, **method_kwargs)
+        return [result] * len(self._get_indices(indices))
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False] * len(self._get_indices(indices))
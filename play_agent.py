@@ -1,16 +1,29 @@
 import time
 import gymnasium as gym
+import torch
 from stable_baselines3 import PPO
 from flappy_env import FlappyEnv
 
 env = FlappyEnv(render_mode="human")
-model = PPO.load("ppo_flappy", env=env)
+model = PPO.load("ppo_flappy", env=env, device="cpu")
+
+# Deterministic play only needs argmax(action logits). The features
+# extractor is a plain Flatten for our 1-D Box obs, so the actor is just
+# policy_net -> action_net; call it directly instead of going through
+# model.predict (obs preprocessing, distribution objects) every tick.
+actor = torch.nn.Sequential(
+    model.policy.mlp_extractor.policy_net,
+    model.policy.action_net,
+).eval()
+obs_tensor = torch.zeros(1, 4)
 
 obs, _ = env.reset()
-while True:
-    action, _ = model.predict(obs, deterministic=True)
-    obs, reward, term, trunc, info = env.step(action)
-    if term or trunc:
-        print("Score:", info["score"])
-        time.sleep(1)
-        obs, _ = env.reset()
+with torch.inference_mode():
+    while True:
+        obs_tensor[0] = torch.from_numpy(obs)
+        action = int(actor(obs_tensor).argmax())
+        obs, reward, term, trunc, info = env.step(action)
+        if term or trunc:
+            print("Score:", info["score"])
+            time.sleep(1)
+            obs, _ = env.reset()
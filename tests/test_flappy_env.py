@@ -0,0 +1,105 @@
+from unittest import mock
+
+import numpy as np
+import pygame as pg
+
+from flappy_env import FlappyEnv
+from flappy_vec_env import FlappyVecEnv
+
+
+def _policy(obs, rng):
+    # flap when below the gap centre, with some noise so episodes vary
+    return int(obs[0] > 0 and rng.random() < 0.3)
+
+
+def _rollout(env, seed, steps):
+    rng = np.random.default_rng(seed)
+    obs, _ = env.reset(seed=seed)
+    trace = []
+    for _ in range(steps):
+        obs, reward, term, trunc, info = env.step(_policy(obs, rng))
+        trace.append((obs.copy(), reward, term, trunc, info["score"]))
+        if term or trunc:
+            obs, _ = env.reset()
+    return trace
+
+
+def test_headless_never_builds_rects():
+    with mock.patch.object(pg, "Rect") as rect:
+        env = FlappyEnv(render_mode=None)
+        trace = _rollout(env, seed=0, steps=20_000)
+        env.close()
+    assert sum(term for _, _, term, _, _ in trace) > 1  # crossed resets
+    assert rect.call_count == 0
+
+
+def test_observations_stay_in_observation_space():
+    env = FlappyEnv()
+    for obs, *_ in _rollout(env, seed=1, steps=20_000):
+        assert env.observation_space.contains(obs), obs
+
+
+def test_same_seed_replays_identically():
+    a = _rollout(FlappyEnv(), seed=2, steps=5_000)
+    b = _rollout(FlappyEnv(), seed=2, steps=5_000)
+    for (obs_a, *rest_a), (obs_b, *rest_b) in zip(a, b):
+        np.testing.assert_array_equal(obs_a, obs_b)
+        assert rest_a == rest_b
+
+
+def test_vec_env_autoresets_within_bounds():
+    venv = FlappyVecEnv(8, max_episode_steps=500, seed=3)
+    obs = venv.reset()
+    rng = np.random.default_rng(3)
+    finished = 0
+    for _ in range(2_000):
+        actions = ((obs[:, 0] > 0) & (rng.random(8) < 0.3)).astype(np.int64)
+        obs, rewards, dones, infos = venv.step(actions)
+        assert obs.dtype == np.float32 and rewards.dtype == np.float32
+        assert venv.observation_space.contains(obs[0])
+        assert np.all(np.abs(obs) <= 1.0)
+        for k in np.flatnonzero(dones):
+            finished += 1
+            assert "terminal_observation" in infos[k]
+            assert venv.tick[k] == 0 and venv.n_pipes[k] == 0
+    assert finished > 0
+
+
+def test_truncates_exactly_at_max_episode_steps():
+    env = FlappyEnv(max_episode_steps=150)
+    rng = np.random.default_rng(4)
+    obs, _ = env.reset(seed=4)
+    ticks, outcomes = 0, set()
+    for _ in range(5_000):
+        obs, _, term, trunc, _ = env.step(_policy(obs, rng))
+        ticks += 1
+        assert not (term and trunc)
+        if not term:
+            assert trunc == (ticks == 150)
+        if term or trunc:
+            outcomes.add("trunc" if trunc else "term")
+            obs, _ = env.reset()
+            ticks = 0
+    assert outcomes == {"term", "trunc"}
+
+
+def test_vec_env_reports_time_limit_truncation():
+    venv = FlappyVecEnv(4, max_episode_steps=30, seed=5)
+    venv.reset()
+    idle = np.zeros(4, dtype=np.int64)
+    for _ in range(29):
+        _, _, dones, _ = venv.step(idle)
+        assert not dones.any()
+    _, _, dones, infos = venv.step(idle)
+    assert dones.all()
+    assert all(info["TimeLimit.truncated"] for info in infos)
+
+    # without flapping the square hits the floor long before the limit
+    venv = FlappyVecEnv(4, max_episode_steps=None, seed=5)
+    venv.reset()
+    for _ in range(200):
+        _, _, dones, infos = venv.step(idle)
+        if dones.any():
+            break
+    assert dones.all()
+    assert not any(info["TimeLimit.truncated"] for info in infos)